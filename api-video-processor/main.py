@@ -7,15 +7,22 @@ Deploy: Railway (or Render, Fly.io)
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, computed_field
 from typing import Optional, List
+from dataclasses import dataclass
+from functools import cached_property
 import uuid
+import hashlib
 import os
 import asyncio
+import shutil
 import subprocess
 import tempfile
+import time
+import aiofiles
 import aiohttp
-import requests
+import redis.asyncio as redis
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 # ============================================================
@@ -33,6 +40,18 @@ class VideoClip(BaseModel):
     cropScale: Optional[float] = 1.0
     useFullFrame: Optional[bool] = False
 
+    # Crop offsets rounded once at validation time; command building uses
+    # these instead of re-rounding per clip on every request
+    @computed_field
+    @cached_property
+    def cropX(self) -> int:
+        return int(round(self.cropPosition.x))
+
+    @computed_field
+    @cached_property
+    def cropY(self) -> int:
+        return int(round(self.cropPosition.y))
+
 class ExportRequest(BaseModel):
     videoUrl: str
     clips: List[VideoClip]
@@ -41,18 +60,27 @@ class ExportRequest(BaseModel):
     strategy: str = "smart-crop"
     sourceRegion: Optional[dict] = None
 
-class JobStatus(BaseModel):
-    jobId: str
-    status: str  # pending, processing, completed, failed
-    progress: float
-    outputUrl: Optional[str] = None
-    error: Optional[str] = None
 
 # ============================================================
 # APP & STATE
 # ============================================================
 
-app = FastAPI(title="Video Processing Service")
+# Shared HTTP session (created at startup, reused for every download and
+# upload so TCP/TLS handshakes and DNS lookups are amortized across jobs)
+http_session: Optional[aiohttp.ClientSession] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_session
+    http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=64, ttl_dns_cache=300)
+    )
+    sweeper = asyncio.create_task(_sweep_temp_dir())
+    yield
+    sweeper.cancel()
+    await http_session.close()
+
+app = FastAPI(title="Video Processing Service", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -62,201 +90,629 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory job storage (use Redis for production)
+# Job storage: Redis when configured (shared across workers/replicas,
+# bounded by TTL), otherwise an in-process dict for local development
+REDIS_URL = os.getenv("REDIS_URL")
+redis_client = redis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None
 jobs = {}
+JOB_TTL = 3600  # seconds a job record sticks around after its last update
+
+async def set_job(job_id: str, **fields) -> None:
+    """Create or update a job record"""
+    if redis_client is not None:
+        key = f"job:{job_id}"
+        await redis_client.hset(key, mapping={k: str(v) for k, v in fields.items()})
+        await redis_client.expire(key, JOB_TTL)
+    else:
+        jobs.setdefault(job_id, {}).update(fields)
+
+async def get_job(job_id: str) -> Optional[dict]:
+    """Fetch a job record, or None if unknown/expired"""
+    if redis_client is not None:
+        data = await redis_client.hgetall(f"job:{job_id}")
+        if not data:
+            return None
+        data['progress'] = float(data.get('progress', 0))
+        return data
+    return jobs.get(job_id)
 
 # Temp directory for processing
 TEMP_DIR = Path("/tmp/video-processor")
 TEMP_DIR.mkdir(exist_ok=True)
 
+# Source-download cache, bounded by a total-bytes LRU budget
+CACHE_DIR = TEMP_DIR / "cache"
+CACHE_DIR.mkdir(exist_ok=True)
+CACHE_MAX_BYTES = int(os.getenv("VIDEO_CACHE_BYTES", str(20 << 30)))
+_cache_lock = asyncio.Lock()
+
+# Cap concurrent ffmpeg runs so the aggregate thread count stays close to
+# the core count; unbounded jobs each running -threads 0 thrash the scheduler
+MAX_CONCURRENT = int(os.getenv("MAX_CONCURRENT", "2"))
+FFMPEG_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT)
+THREADS_PER_JOB = max(1, (os.cpu_count() or 1) // MAX_CONCURRENT)
+
 # ============================================================
 # HELPER FUNCTIONS
 # ============================================================
 
 VERCEL_BLOB_TOKEN = os.getenv("BLOB_READ_WRITE_TOKEN")
 
-def upload_to_vercel_blob(file_path: str, filename: str) -> str:
-    """Upload file to Vercel Blob Storage and return URL"""
-    url = f"https://blob.vercel-storage.com/{filename}"
-    with open(file_path, 'rb') as f:
-        response = requests.put(
-            url,
-            data=f,
-            headers={
-                "authorization": f"Bearer {VERCEL_BLOB_TOKEN}",
-                "x-api-version": "3",
-                "content-type": "video/mp4",
-            }
+class FFmpegError(Exception):
+    """An ffmpeg run exited nonzero"""
+
+@dataclass(frozen=True)
+class FFmpegCaps:
+    """FFmpeg capabilities, probed once so command building never forks"""
+    hwaccels: frozenset
+    encoders: frozenset
+    filters: frozenset
+
+    @property
+    def cuda_pipeline(self) -> bool:
+        """Whole GPU path usable: cuda decode, CUDA crop/scale filters, NVENC
+
+        -hwaccels only reflects compile-time support, and scale_npp/crop_cuda
+        are missing from most cuda-enabled builds, so every link of the graph
+        has to be checked before swapping filter names.
+        """
+        return (
+            "cuda" in self.hwaccels
+            and "h264_nvenc" in self.encoders
+            and "crop_cuda" in self.filters
+            and "scale_npp" in self.filters
         )
-    if response.status_code not in (200, 201):
-        raise Exception(f"Failed to upload to Vercel Blob: {response.text}")
-    return response.json()['url']
-
-async def download_video(url: str, dest_path: Path) -> None:
-    """Download video from URL to local file"""
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status != 200:
-                raise HTTPException(status_code=400, detail=f"Failed to download video: {url}")
-            with open(dest_path, 'wb') as f:
-                f.write(await response.read())
+
+def _probe_ffmpeg_caps() -> FFmpegCaps:
+    """Probe ffmpeg hardware accelerators, encoders and filters at startup"""
+    def run(args: List[str]) -> str:
+        try:
+            result = subprocess.run(
+                ["ffmpeg", "-hide_banner"] + args,
+                capture_output=True,
+                text=True,
+                timeout=10,
+            )
+            return result.stdout
+        except (OSError, subprocess.TimeoutExpired):
+            return ""
+
+    hwaccels = {line.strip() for line in run(["-hwaccels"]).splitlines()[1:] if line.strip()}
+    encoders = {
+        parts[1] for line in run(["-encoders"]).splitlines()
+        if len(parts := line.split()) > 1
+    }
+    filters = {
+        parts[1] for line in run(["-filters"]).splitlines()
+        if len(parts := line.split()) > 1
+    }
+    return FFmpegCaps(
+        hwaccels=frozenset(hwaccels),
+        encoders=frozenset(encoders),
+        filters=frozenset(filters),
+    )
+
+CAPS = _probe_ffmpeg_caps()
+
+async def _put_vercel_blob(filename: str, data) -> str:
+    """PUT a request body to Vercel Blob Storage and return the blob URL"""
+    url = f"https://blob.vercel-storage.com/{filename}"
+    async with http_session.put(
+        url,
+        data=data,
+        headers={
+            "authorization": f"Bearer {VERCEL_BLOB_TOKEN}",
+            "x-api-version": "3",
+            "content-type": "video/mp4",
+        }
+    ) as response:
+        if response.status not in (200, 201):
+            raise Exception(f"Failed to upload to Vercel Blob: {await response.text()}")
+        return (await response.json())['url']
+
+async def upload_stream_to_vercel_blob(stream: asyncio.StreamReader, filename: str) -> str:
+    """Stream bytes to Vercel Blob Storage and return the blob URL"""
+    async def chunks():
+        while True:
+            chunk = await stream.read(1 << 20)
+            if not chunk:
+                break
+            yield chunk
+
+    return await _put_vercel_blob(filename, chunks())
+
+async def download_video(url: str, dest_path: Path) -> Optional[str]:
+    """Stage the source to disk; returns the response ETag when provided"""
+    async with http_session.get(url) as response:
+        if response.status != 200:
+            raise Exception(f"Failed to download video: {url}")
+        async with aiofiles.open(dest_path, 'wb') as f:
+            async for chunk in response.content.iter_chunked(1 << 20):
+                await f.write(chunk)
+        return response.headers.get("ETag")
+
+async def _source_unchanged(url: str, etag: str) -> bool:
+    """Conditional probe: does the remote still match our cached copy?"""
+    async with http_session.head(url, headers={"If-None-Match": etag}) as response:
+        return response.status == 304
+
+def _evict_cache(keep: Path) -> None:
+    """Drop least-recently-used cache entries until under the byte budget"""
+    files = sorted(CACHE_DIR.glob("*.mp4"), key=lambda p: p.stat().st_mtime)
+    total = sum(p.stat().st_size for p in files)
+    for path in files:
+        if total <= CACHE_MAX_BYTES:
+            break
+        if path == keep:
+            continue
+        total -= path.stat().st_size
+        path.unlink(missing_ok=True)
+        path.with_suffix(".etag").unlink(missing_ok=True)
+
+# One lock per cache key so concurrent misses on the same URL download
+# once instead of interleaving writes into the same staging file
+_download_locks: dict = {}
+
+async def get_cached_video(url: str) -> Path:
+    """Return a local copy of the source, reusing the cache across jobs
+
+    Repeat exports of the same videoUrl (a user tweaking crops) hit the
+    cached staging file instead of re-downloading the master.
+    """
+    key = hashlib.sha256(url.encode()).hexdigest()
+    path = CACHE_DIR / f"{key}.mp4"
+    etag_path = CACHE_DIR / f"{key}.etag"
+
+    lock = _download_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        if path.exists():
+            etag = etag_path.read_text() if etag_path.exists() else None
+            if etag is None or await _source_unchanged(url, etag):
+                os.utime(path)  # refresh LRU position
+                return path
+
+        # Download to a uniquely named .part file and publish it with an
+        # atomic rename, so a reader never sees a torso even if a stale
+        # writer is still around
+        part = CACHE_DIR / f"{key}.{uuid.uuid4().hex}.part"
+        try:
+            etag = await download_video(url, part)
+            part.replace(path)
+        finally:
+            part.unlink(missing_ok=True)
+        if etag:
+            etag_path.write_text(etag)
+
+    async with _cache_lock:
+        _evict_cache(keep=path)
+    return path
+
+# Per-clip filter stage templates: {src}/{label} are the input/output pads,
+# {crop}/{scale} the (possibly CUDA) filter names. Every stage trims first
+# so crop/scale only touch frames that are kept.
+TPL_CENTER = (
+    "[{src}]trim={s}:{e},setpts=PTS-STARTPTS,"
+    "scale={w}:{h}:force_original_aspect_ratio=decrease,"
+    "pad={w}:{h}:(ow-iw)/2:(oh-ih)/2[{label}];"
+)
+TPL_CROP_SCALE = (
+    "[{src}]trim={s}:{e},setpts=PTS-STARTPTS,"
+    "{crop}={cw}:{ch}:{x}:{y},{scale}={w}:{h}[{label}];"
+)
+TPL_CROP = (
+    "[{src}]trim={s}:{e},setpts=PTS-STARTPTS,"
+    "{crop}={w}:{h}:{x}:{y}[{label}];"
+)
+TPL_AUDIO = "[{src}]atrim={s}:{e},asetpts=PTS-STARTPTS[{label}];"
+
+def _mux_args(output_path: str) -> List[str]:
+    """Container/mux arguments for the final output target"""
+    if output_path == "pipe:1":
+        # Fragmented MP4 muxes in a single forward pass, so the output can
+        # be piped; +faststart needs a seekable file to rewrite the moov atom
+        return [
+            "-f", "mp4",
+            "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+            "-frag_duration", "1000000",
+            output_path
+        ]
+    return ["-movflags", "+faststart", output_path]
+
+def _is_identity_transform(
+    clips: List[VideoClip],
+    width: int,
+    height: int,
+    strategy: str,
+    source_region: Optional[dict]
+) -> bool:
+    """True when every clip's crop/scale is provably a no-op
+
+    Only an explicit sourceRegion whose dimensions match the target frame
+    counts: the defaulted values make the dimension check vacuous, and a
+    (0,0)-anchored crop is still a real crop of a larger source.
+    """
+    if source_region is None or strategy == "center-crop":
+        return False
+    src_crop_width = source_region.get('width', width)
+    src_crop_height = source_region.get('height', height)
+    return (
+        src_crop_width == width
+        and src_crop_height == height
+        and all(c.cropX == 0 and c.cropY == 0 for c in clips)
+    )
 
 def build_ffmpeg_command(
     input_path: str,
     output_path: str,
-    clips: List[VideoClip],
+    clip: VideoClip,
     width: int,
     height: int,
     strategy: str,
-    source_region: Optional[dict]
+    source_region: Optional[dict],
+    allow_copy: bool = True,
+    preset: Optional[str] = None
 ) -> List[str]:
-    """Build FFmpeg command for video processing"""
-    cmd = ["-i", input_path]
-
+    """Build FFmpeg command for processing a single clip
+
+    Multi-clip jobs fan out one command per clip and concat the fragments,
+    so this only ever emits a single-clip graph. allow_copy lets callers
+    veto the stream-copy fast path, and preset overrides the per-clip
+    x264 preset choice, for when fragments must share codec parameters
+    with their siblings.
+    """
     src_crop_width = source_region.get('width', width) if source_region else width
     src_crop_height = source_region.get('height', height) if source_region else height
 
-    filter_complex = ""
-    map_args = []
-
-    if len(clips) == 1:
-        # Single clip
-        clip = clips[0]
-        crop_x = int(round(clip.cropPosition.x))
-        crop_y = int(round(clip.cropPosition.y))
-
-        if strategy == "center-crop":
-            filter_complex = (
-                f"[0:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
-                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,"
-                f"trim={clip.startTime}:{clip.endTime},setpts=PTS-STARTPTS[vout];"
-                f"[0:a]atrim={clip.startTime}:{clip.endTime},asetpts=PTS-STARTPTS[aout]"
-            )
-        else:
-            if src_crop_width != width or src_crop_height != height:
-                filter_complex = (
-                    f"[0:v]crop={src_crop_width}:{src_crop_height}:{crop_x}:{crop_y},"
-                    f"scale={width}:{height},"
-                    f"trim={clip.startTime}:{clip.endTime},setpts=PTS-STARTPTS[vout];"
-                    f"[0:a]atrim={clip.startTime}:{clip.endTime},asetpts=PTS-STARTPTS[aout]"
-                )
-            else:
-                filter_complex = (
-                    f"[0:v]crop={width}:{height}:{crop_x}:{crop_y},"
-                    f"trim={clip.startTime}:{clip.endTime},setpts=PTS-STARTPTS[vout];"
-                    f"[0:a]atrim={clip.startTime}:{clip.endTime},asetpts=PTS-STARTPTS[aout]"
-                )
+    # Stream-copy fast path: remux the clip range without decoding or
+    # re-encoding when the filter graph would be a no-op. -ss before -i
+    # seeks the input demuxer, which snaps to the previous keyframe -
+    # output-side -ss under -c copy would drop packets mid-GOP and leave
+    # the clip undecodable until the next IDR
+    if allow_copy and _is_identity_transform([clip], width, height, strategy, source_region):
+        return (
+            ["ffmpeg", "-y",
+             "-ss", str(clip.startTime),
+             "-i", input_path,
+             "-t", str(clip.endTime - clip.startTime),
+             "-c", "copy"]
+            + _mux_args(output_path)
+        )
 
-        cmd.extend(["-filter_complex", filter_complex])
-        cmd.extend(["-map", "[vout]", "-map", "[aout]"])
+    # CUDA keeps decode, crop/scale and encode on the GPU; center-crop needs
+    # the pad filter which has no CUDA equivalent, so it stays on the CPU path
+    use_cuda = CAPS.cuda_pipeline and strategy != "center-crop"
+    crop_filter = "crop_cuda" if use_cuda else "crop"
+    scale_filter = "scale_npp" if use_cuda else "scale"
+
+    cmd = []
+    if use_cuda:
+        cmd.extend(["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"])
+    cmd.extend(["-i", input_path])
+
+    if strategy == "center-crop":
+        template = TPL_CENTER
+    elif src_crop_width != width or src_crop_height != height:
+        template = TPL_CROP_SCALE
     else:
-        # Multiple clips - concat
-        for i, clip in enumerate(clips):
-            crop_x = int(round(clip.cropPosition.x))
-            crop_y = int(round(clip.cropPosition.y))
-
-            if strategy == "center-crop":
-                filter_complex += (
-                    f"[0:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
-                    f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,"
-                    f"trim={clip.startTime}:{clip.endTime},setpts=PTS-STARTPTS[v{i}];"
-                )
-            else:
-                if src_crop_width != width or src_crop_height != height:
-                    filter_complex += (
-                        f"[0:v]crop={src_crop_width}:{src_crop_height}:{crop_x}:{crop_y},"
-                        f"scale={width}:{height},"
-                        f"trim={clip.startTime}:{clip.endTime},setpts=PTS-STARTPTS[v{i}];"
-                    )
-                else:
-                    filter_complex += (
-                        f"[0:v]crop={width}:{height}:{crop_x}:{crop_y},"
-                        f"trim={clip.startTime}:{clip.endTime},setpts=PTS-STARTPTS[v{i}];"
-                    )
-
-            filter_complex += f"[0:a]atrim={clip.startTime}:{clip.endTime},asetpts=PTS-STARTPTS[a{i}];"
+        template = TPL_CROP
+
+    stage_args = {
+        "s": clip.startTime, "e": clip.endTime,
+        "x": clip.cropX, "y": clip.cropY,
+        "w": width, "h": height,
+        "cw": src_crop_width, "ch": src_crop_height,
+        "crop": crop_filter, "scale": scale_filter,
+    }
+    parts = [
+        template.format_map({**stage_args, "src": "0:v", "label": "vout"}),
+        TPL_AUDIO.format_map({**stage_args, "src": "0:a", "label": "aout"}),
+    ]
 
-        # Concat
-        video_inputs = "".join([f"[v{i}]" for i in range(len(clips))])
-        audio_inputs = "".join([f"[a{i}]" for i in range(len(clips))])
-        filter_complex += f"{video_inputs}concat=n={len(clips)}:v=1:a=0[vout];"
-        filter_complex += f"{audio_inputs}concat=n={len(clips)}:v=0:a=1[aout]"
+    filter_complex = "".join(parts).rstrip(";")
 
-        cmd.extend(["-filter_complex", filter_complex])
-        cmd.extend(["-map", "[vout]", "-map", "[aout]"])
+    cmd.extend(["-filter_complex", filter_complex])
+    cmd.extend(["-map", "[vout]", "-map", "[aout]"])
 
     # Encoding settings for speed
+    if use_cuda:
+        # NVENC ASIC encodes H.264 several times faster than x264 on CPU
+        cmd.extend([
+            "-c:v", "h264_nvenc",
+            "-preset", "p1",
+            "-tune", "ll",
+            "-rc", "vbr",
+            "-cq", "23",
+            "-b:v", "0",
+        ])
+    else:
+        # veryfast is the knee of the x264 speed/size curve for offline
+        # encodes; ultrafast only pays off when there's barely anything
+        # to encode. No -tune zerolatency: it disables b-frames and
+        # forces sliced threads, hurting both throughput and file size.
+        if preset is None:
+            duration = clip.endTime - clip.startTime
+            preset = "ultrafast" if duration < 2 else "veryfast"
+        cmd.extend([
+            "-c:v", "libx264",
+            "-preset", preset,
+            "-crf", "23",
+            "-pix_fmt", "yuv420p",
+            "-threads", str(THREADS_PER_JOB),
+            # Frame-parallel threads sized to the per-job budget; sliced
+            # threads off (zerolatency's leftover) and a short lookahead
+            # keep pipeline-fill latency low on short clips
+            "-x264-params",
+            f"threads={THREADS_PER_JOB}:sliced-threads=0"
+            ":lookahead_threads=1:sync-lookahead=0:rc-lookahead=10",
+        ])
     cmd.extend([
-        "-c:v", "libx264",
-        "-preset", "ultrafast",
-        "-crf", "23",
-        "-tune", "zerolatency",
-        "-pix_fmt", "yuv420p",
         "-c:a", "aac",
         "-b:a", "192k",
-        "-movflags", "+faststart",
-        output_path
     ])
+    cmd.extend(_mux_args(output_path))
 
     return ["ffmpeg", "-y"] + cmd
 
-async def process_video_job(job_id: str, request: ExportRequest) -> None:
-    """Process video in background"""
-    try:
-        jobs[job_id].status = "processing"
-        jobs[job_id].progress = 10
-
-        # Create temp directory for this job
-        job_dir = TEMP_DIR / job_id
-        job_dir.mkdir(exist_ok=True)
-
-        input_path = job_dir / "input.mp4"
-        output_path = job_dir / "output.mp4"
-
-        # Download video
-        await download_video(request.videoUrl, input_path)
-        jobs[job_id].progress = 30
-
-        # Build and run FFmpeg command
-        cmd = build_ffmpeg_command(
-            str(input_path),
-            str(output_path),
-            request.clips,
-            request.width,
-            request.height,
-            request.strategy,
-            request.sourceRegion
+async def _encode_clip(
+    input_path: Path,
+    output_path: Path,
+    clip: VideoClip,
+    width: int,
+    height: int,
+    strategy: str,
+    source_region: Optional[dict],
+    allow_copy: bool,
+    preset: str
+) -> None:
+    """Encode one clip to a fragment file, gated by the ffmpeg semaphore"""
+    cmd = build_ffmpeg_command(
+        str(input_path),
+        str(output_path),
+        clip,
+        width,
+        height,
+        strategy,
+        source_region,
+        allow_copy=allow_copy,
+        preset=preset
+    )
+
+    async with FFMPEG_SEMAPHORE:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
         )
+        try:
+            await process.communicate()
+        finally:
+            # On cancellation (a sibling fragment failed) don't leave
+            # ffmpeg writing into a job dir that is about to be removed,
+            # or holding a semaphore slot from beyond the task's grave
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    if process.returncode != 0:
+        raise FFmpegError(f"FFmpeg failed with code {process.returncode}")
+
+async def _process_single_clip(job_id: str, request: ExportRequest) -> str:
+    """Stream download -> ffmpeg -> blob upload in one pipeline
+
+    Falls back to a staged file when the piped run fails: MP4s whose moov
+    atom trails the mdat (no +faststart at origin) cannot be demuxed from
+    a non-seekable stdin, and ffmpeg rejects them immediately.
+    """
+    try:
+        return await _run_single_clip(job_id, request, "pipe:0")
+    except FFmpegError:
+        input_path = await get_cached_video(request.videoUrl)
+        await set_job(job_id, progress=30)
+        return await _run_single_clip(job_id, request, str(input_path))
+
+async def _run_single_clip(job_id: str, request: ExportRequest, input_path: str) -> str:
+    """One ffmpeg pass for a single clip, output streamed to blob storage"""
+    cmd = build_ffmpeg_command(
+        input_path,
+        "pipe:1",
+        request.clips[0],
+        request.width,
+        request.height,
+        request.strategy,
+        request.sourceRegion
+    )
 
-        print(f"[{job_id}] Running FFmpeg: {' '.join(cmd)}")
+    print(f"[{job_id}] Running FFmpeg: {' '.join(cmd)}")
+    use_stdin = input_path == "pipe:0"
 
+    async with FFMPEG_SEMAPHORE:
         process = await asyncio.create_subprocess_exec(
             *cmd,
+            stdin=asyncio.subprocess.PIPE if use_stdin else asyncio.subprocess.DEVNULL,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE
         )
 
-        await process.communicate()
+        # Stream the download straight into ffmpeg instead of staging it:
+        # the bytes cross the kernel once, nothing is buffered in memory
+        # or written to an input file first
+        async def feed_input():
+            async with http_session.get(request.videoUrl) as response:
+                if response.status != 200:
+                    raise Exception(f"Failed to download video: {request.videoUrl}")
+                await set_job(job_id, progress=30)
+                try:
+                    async for chunk in response.content.iter_chunked(1 << 20):
+                        process.stdin.write(chunk)
+                        await process.stdin.drain()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # ffmpeg can exit once trim has all its frames
+            process.stdin.close()
+
+        # Encoded output streams straight to Vercel Blob as it is produced -
+        # no output.mp4 staging, no re-read for the upload. The TaskGroup
+        # cancels the other legs when one fails, and the finally block reaps
+        # ffmpeg so a dead upload can't leave it blocked on a full stdout
+        # pipe (or, for stdin feeds, waiting forever for more input)
+        pipeline_error = None
+        killed = False
+        try:
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    if use_stdin:
+                        tg.create_task(feed_input())
+                    upload = tg.create_task(
+                        upload_stream_to_vercel_blob(process.stdout, f"{job_id}_output.mp4")
+                    )
+                    tg.create_task(process.stderr.read())
+            except* Exception as eg:
+                pipeline_error = eg.exceptions[0]
+            else:
+                await process.wait()
+        finally:
+            if use_stdin and process.stdin and not process.stdin.is_closing():
+                process.stdin.close()
+            if process.returncode is None:
+                killed = True
+                process.kill()
+                await process.wait()
+
+    # A nonzero exit from ffmpeg itself (not from our kill) wins over any
+    # secondary pipeline failure: it is what the stdin fallback keys on
+    if not killed and process.returncode != 0:
+        raise FFmpegError(f"FFmpeg failed with code {process.returncode}")
+    if pipeline_error is not None:
+        raise pipeline_error
+
+    return upload.result()
+
+async def _process_multi_clip(job_id: str, request: ExportRequest) -> str:
+    """Encode clips as parallel fragment files, then stream-copy concat"""
+    job_dir = TEMP_DIR / job_id
+    job_dir.mkdir(exist_ok=True)
+    try:
+        return await _run_multi_clip(job_id, job_dir, request)
+    finally:
+        # Always reclaim the fragment directory, including on failure;
+        # leaked job dirs eventually fill /tmp and stall every encode
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+async def _run_multi_clip(job_id: str, job_dir: Path, request: ExportRequest) -> str:
+    # Fragments each re-read the source, so it has to be seekable on disk;
+    # the cache spares a re-download when the same source is exported again
+    input_path = await get_cached_video(request.videoUrl)
+    await set_job(job_id, progress=30)
+
+    # One ffmpeg per clip; the semaphore keeps aggregate threads bounded
+    # while clips scale with core count instead of serializing inside a
+    # single filter graph
+    # concat -c copy needs every fragment to share codec parameters, so
+    # the stream-copy fast path is only allowed when every clip qualifies;
+    # one re-encoded clip forces all fragments through the encoder
+    allow_copy = _is_identity_transform(
+        request.clips, request.width, request.height,
+        request.strategy, request.sourceRegion
+    )
+    # The preset is also a codec parameter (profile, entropy coder and
+    # B-frames all differ between ultrafast and veryfast), so it is
+    # decided once for the whole job rather than per fragment
+    total_duration = sum(c.endTime - c.startTime for c in request.clips)
+    preset = "ultrafast" if total_duration < 2 else "veryfast"
+    fragment_paths = [job_dir / f"frag_{i}.mp4" for i in range(len(request.clips))]
+    try:
+        async with asyncio.TaskGroup() as tg:
+            for frag, clip in zip(fragment_paths, request.clips):
+                tg.create_task(_encode_clip(
+                    input_path, frag, clip,
+                    request.width, request.height,
+                    request.strategy, request.sourceRegion,
+                    allow_copy, preset
+                ))
+    except* Exception as eg:
+        raise eg.exceptions[0]
+    await set_job(job_id, progress=70)
+
+    # Stitch the fragments without re-encoding, streaming the remuxed
+    # result straight to the blob upload instead of staging an output.mp4
+    list_path = job_dir / "fragments.txt"
+    list_path.write_text("".join(f"file '{p}'\n" for p in fragment_paths))
+
+    concat_cmd = [
+        "ffmpeg", "-y",
+        "-f", "concat", "-safe", "0",
+        "-i", str(list_path),
+        "-c", "copy",
+    ] + _mux_args("pipe:1")
+    process = await asyncio.create_subprocess_exec(
+        *concat_cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
 
-        if process.returncode != 0:
-            raise Exception(f"FFmpeg failed with code {process.returncode}")
+    # Same reaping discipline as the single-clip pipeline: a failed upload
+    # must not leave the concat process blocked on a full stdout pipe,
+    # outliving the job dir it is reading from
+    try:
+        try:
+            async with asyncio.TaskGroup() as tg:
+                upload = tg.create_task(
+                    upload_stream_to_vercel_blob(process.stdout, f"{job_id}_output.mp4")
+                )
+                tg.create_task(process.stderr.read())
+        except* Exception as eg:
+            raise eg.exceptions[0]
+        await process.wait()
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+    if process.returncode != 0:
+        raise FFmpegError(f"FFmpeg concat failed with code {process.returncode}")
+
+    await set_job(job_id, progress=90)
+    return upload.result()
+
+async def _sweep_temp_dir() -> None:
+    """Periodically prune job dirs orphaned by crashes or hard restarts"""
+    while True:
+        await asyncio.sleep(300)
+        cutoff = time.time() - 3600
+        for entry in TEMP_DIR.iterdir():
+            if entry == CACHE_DIR:
+                # The cache has its own LRU byte budget; only reclaim
+                # .part files orphaned by downloads that died mid-write
+                for part in entry.glob("*.part"):
+                    try:
+                        if part.stat().st_mtime < cutoff:
+                            part.unlink(missing_ok=True)
+                    except OSError:
+                        pass
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    if entry.is_dir():
+                        shutil.rmtree(entry, ignore_errors=True)
+                    else:
+                        entry.unlink(missing_ok=True)
+            except OSError:
+                pass  # raced with a job cleaning up after itself
 
-        jobs[job_id].progress = 90
+async def process_video_job(job_id: str, request: ExportRequest) -> None:
+    """Process video in background"""
+    try:
+        await set_job(job_id, status="processing", progress=10)
 
-        # Upload to Vercel Blob
-        output_url = upload_to_vercel_blob(str(output_path), f"{job_id}_output.mp4")
-        jobs[job_id].outputUrl = output_url
-        jobs[job_id].status = "completed"
-        jobs[job_id].progress = 100
+        if len(request.clips) == 1:
+            output_url = await _process_single_clip(job_id, request)
+        else:
+            output_url = await _process_multi_clip(job_id, request)
 
-        # Cleanup
-        input_path.unlink(missing_ok=True)
-        output_path.unlink(missing_ok=True)
+        await set_job(job_id, status="completed", progress=100, outputUrl=output_url)
 
     except Exception as e:
         print(f"[{job_id}] Error: {e}")
-        jobs[job_id].status = "failed"
-        jobs[job_id].error = str(e)
+        await set_job(job_id, status="failed", error=str(e))
 
 # ============================================================
 # API ROUTES
@@ -267,11 +723,7 @@ async def create_export_job(request: ExportRequest, background_tasks: Background
     """Create a new video export job"""
     job_id = str(uuid.uuid4())
 
-    jobs[job_id] = JobStatus(
-        jobId=job_id,
-        status="pending",
-        progress=0
-    )
+    await set_job(job_id, jobId=job_id, status="pending", progress=0)
 
     # Process in background
     background_tasks.add_task(process_video_job, job_id, request)
@@ -281,37 +733,34 @@ async def create_export_job(request: ExportRequest, background_tasks: Background
 @app.get("/status/{job_id}")
 async def get_job_status(job_id: str):
     """Get job status"""
-    if job_id not in jobs:
+    job = await get_job(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    job = jobs[job_id]
-
-    # Return output data if completed
     response = {
-        "jobId": job.jobId,
-        "status": job.status,
-        "progress": job.progress,
-        "error": job.error
+        "jobId": job_id,
+        "status": job.get("status"),
+        "progress": job.get("progress", 0),
+        "error": job.get("error")
     }
 
-    if job.status == "completed" and hasattr(job, 'outputUrl'):
-        response["outputUrl"] = job.outputUrl
+    if job.get("status") == "completed" and job.get("outputUrl"):
+        response["outputUrl"] = job["outputUrl"]
 
     return response
 
 @app.get("/download/{job_id}")
 async def download_result(job_id: str):
     """Download processed video (redirects to Vercel Blob URL)"""
-    if job_id not in jobs:
+    job = await get_job(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    job = jobs[job_id]
-
-    if job.status != "completed" or not hasattr(job, 'outputUrl'):
+    if job.get("status") != "completed" or not job.get("outputUrl"):
         raise HTTPException(status_code=400, detail="Job not completed")
 
     from fastapi.responses import RedirectResponse
-    return RedirectResponse(url=job.outputUrl, status_code=302)
+    return RedirectResponse(url=job["outputUrl"], status_code=302)
 
 @app.get("/health")
 async def health():